@@ -8,56 +8,375 @@ for Danish public transportation journey planning.
 API Documentation: https://labs.rejseplanen.dk/hc/da/articles/21554723926557-Om-API-2-0
 """
 
+import asyncio
 import os
+import ssl
 import sys
+from contextlib import asynccontextmanager
+from enum import IntEnum
+from threading import Lock
 from typing import Optional, Dict, Any, List
-import requests
+import certifi
+from cachetools import LRUCache, TTLCache
+import httpx
+import orjson
 from fastmcp import FastMCP
 
+
+@asynccontextmanager
+async def _lifespan(server: "FastMCP"):
+    """Close the shared HTTP client when the server shuts down."""
+    try:
+        yield
+    finally:
+        if _client is not None:
+            await _client.aclose()
+
+
 # Initialize FastMCP server
 mcp = FastMCP(
     "Rejseplanen MCP Server",
-    dependencies=["requests"]
+    dependencies=["httpx"],
+    lifespan=_lifespan
 )
 
 # Rejseplanen API configuration
 REJSEPLANEN_API_BASE = "https://xmlopen.rejseplanen.dk/bin/rest.exe"
 REQUEST_TIMEOUT = 30  # seconds
 
+# Shared async client: concurrent tool calls multiplex over one HTTP/2
+# connection without blocking the event loop, and keep-alive avoids paying
+# a fresh TLS handshake on every request. Created lazily on first use --
+# building the client loads the CA bundle and constructs the TLS context,
+# which is noticeable on serverless cold starts.
+_client: Optional[httpx.AsyncClient] = None
 
-def make_api_request(endpoint: str, params: Dict[str, Any]) -> Dict[str, Any]:
+
+def _get_client() -> httpx.AsyncClient:
+    """Return the shared HTTP client, creating it on first use."""
+    global _client
+    if _client is None:
+        # One explicit SSL context shared by every connection in the pool:
+        # the CA bundle is loaded exactly once, and TLS session resumption
+        # turns reconnects after pool eviction into abbreviated handshakes
+        ctx = ssl.create_default_context(cafile=certifi.where())
+        ctx.minimum_version = ssl.TLSVersion.TLSv1_2
+        ctx.set_alpn_protocols(['h2', 'http/1.1'])
+        _client = httpx.AsyncClient(
+            base_url=REJSEPLANEN_API_BASE,
+            params={'format': 'json'},  # every endpoint is queried as JSON
+            headers={
+                # Brotli shrinks the verbose trip/departure JSON bodies further
+                # than gzip; httpx decompresses transparently when brotli is
+                # installed
+                'Accept-Encoding': 'br, gzip',
+                'Accept': 'application/json',
+                'User-Agent': 'rejseplanen-mcp/1.0',
+            },
+            timeout=REQUEST_TIMEOUT,
+            # Pool limits must live on the transport: httpx ignores
+            # client-level limits when an explicit transport is supplied
+            transport=httpx.AsyncHTTPTransport(
+                http2=True,
+                retries=2,
+                verify=ctx,
+                limits=httpx.Limits(max_keepalive_connections=20, max_connections=40),
+            ),
+        )
+    return _client
+
+class RejseplanenError(Exception):
+    """Raised when a Rejseplanen API call fails.
+
+    Carries a short machine-readable ``code`` ('timeout', 'http' or 'parse');
+    the underlying exception, if any, is attached as ``__cause__`` instead of
+    being stringified into the message.
+    """
+    __slots__ = ('code',)
+
+    def __init__(self, message: str, code: str):
+        super().__init__(message)
+        self.code = code
+
+
+class Endpoint(IntEnum):
+    """Closed set of Rejseplanen API endpoints."""
+    LOCATION = 0
+    TRIP = 1
+    DEPARTURES = 2
+    NEARBY = 3
+
+
+# Per-endpoint dispatch table with paths prebuilt once; anything outside the
+# enum fails fast instead of burning a full round trip on a 404
+_ENDPOINT_META: Dict[Endpoint, str] = {
+    Endpoint.LOCATION: "/location",
+    Endpoint.TRIP: "/trip",
+    Endpoint.DEPARTURES: "/departureBoard",
+    Endpoint.NEARBY: "/stopsNearby",
+}
+
+# In-process TTL caches for the deterministic reference-data lookups.
+# Station names and GPS-to-stop mappings change rarely, so repeated queries
+# (common in LLM tool loops) can skip the HTTP round trip entirely.
+_loc_cache: TTLCache = TTLCache(maxsize=1024, ttl=3600)
+_nearby_cache: TTLCache = TTLCache(maxsize=512, ttl=300)
+_cache_lock = Lock()
+
+# Departure boards refresh server-side at most every ~30s, so a 20s TTL cache
+# absorbs repeat polls of the same station. ETags (kept past TTL expiry) let
+# the next miss revalidate with If-None-Match: a 304 carries no body, so the
+# cached board is reused with zero parse cost.
+_dep_cache: TTLCache = TTLCache(maxsize=2048, ttl=20)
+_dep_validators: LRUCache = LRUCache(maxsize=2048)
+_stats = {'dep_cache_hits': 0, 'dep_cache_misses': 0, 'dep_cache_revalidated': 0}
+
+# trip_search results are not cached by default, but a very short TTL
+# (e.g. 10-20s) can be enabled via REJSEPLANEN_REALTIME_CACHE_TTL
+_REALTIME_TTL = int(os.environ.get("REJSEPLANEN_REALTIME_CACHE_TTL", "0"))
+_realtime_cache: Optional[TTLCache] = (
+    TTLCache(maxsize=256, ttl=_REALTIME_TTL) if _REALTIME_TTL > 0 else None
+)
+
+# All 16 combinations of the four transport-mode flags, precomputed so
+# trip_search merges one shared sub-dict instead of branching per flag
+_MODE_TABLE: Dict[int, Dict[str, str]] = {
+    m: {
+        'useTog': '1' if m & 1 else '0',
+        'useBus': '1' if m & 2 else '0',
+        'useMetro': '1' if m & 4 else '0',
+        'useFerry': '1' if m & 8 else '0',
+    }
+    for m in range(16)
+}
+
+# Cap on concurrent upstream requests issued by a single batch call
+_batch_semaphore = asyncio.Semaphore(8)
+
+# Single-flight: concurrent identical requests (e.g. retries or parallel agent
+# steps) attach to the already-running request instead of issuing duplicates
+_inflight: Dict[tuple, "asyncio.Future"] = {}
+_inflight_lock = asyncio.Lock()
+
+# Server metadata is fixed at process start, so build the payload once at
+# import time instead of on every get_server_info call
+_SERVER_INFO: Dict[str, Any] = {
+    "server_name": "Rejseplanen MCP Server",
+    "version": "1.0.0",
+    "environment": os.environ.get("ENVIRONMENT", "development"),
+    "python_version": sys.version.split()[0],
+    "api_base": REJSEPLANEN_API_BASE,
+    "transport": "HTTP (Stateless)",
+    "tools": (
+        "location_search",
+        "trip_search",
+        "trip_search_batch",
+        "departure_board",
+        "nearby_stops",
+        "get_server_info"
+    ),
+    "description": "MCP server for Danish public transportation via Rejseplanen.dk API 2.0"
+}
+
+# Startup banner with the static parts (environment, Python version) baked in
+# at import time; only host/port are filled in when the server starts
+_BANNER = (
+    "🚆 Starting Rejseplanen MCP Server on {host}:{port}\n"
+    "📍 API Endpoint: http://{host}:{port}/mcp\n"
+    f"🌍 Environment: {_SERVER_INFO['environment']}\n"
+    f"🔧 Python Version: {_SERVER_INFO['python_version']}\n"
+    "\n✅ Server ready to accept connections...\n"
+)
+
+
+def _parse_port() -> int:
+    """Read the PORT env var (set by Render and other cloud platforms), failing fast if invalid."""
+    raw = os.environ.get("PORT", "8000")
+    try:
+        return int(raw)
+    except ValueError:
+        raise SystemExit(f"Invalid PORT environment variable: {raw!r}")
+
+
+def _trip_params(
+    origin_id: str,
+    dest_id: str,
+    date: Optional[str] = None,
+    time: Optional[str] = None,
+    use_train: bool = True,
+    use_bus: bool = True,
+    use_metro: bool = True,
+    use_ferry: bool = True
+) -> Dict[str, Any]:
+    """Build and validate the query params for a trip request."""
+    params = {
+        'originId': _require("origin_id", origin_id),
+        'destId': _require("dest_id", dest_id),
+    }
+
+    if date:
+        params['date'] = date
+    if time:
+        params['time'] = time
+
+    # Transport mode filters (0 = exclude, 1 = include)
+    mask = use_train | (use_bus << 1) | (use_metro << 2) | (use_ferry << 3)
+    params.update(_MODE_TABLE[mask])
+    return params
+
+
+def _require(name: str, value: str) -> str:
+    """Strip a required string argument, raising ValueError if it is empty."""
+    stripped = value.strip() if value else ''
+    if not stripped:
+        raise ValueError(f"{name} is required")
+    return stripped
+
+
+async def _cached_api_request(cache: TTLCache, key: Any, endpoint: Endpoint, params: Dict[str, Any]) -> Dict[str, Any]:
+    """Serve a request from the given cache when possible, otherwise fetch and store."""
+    with _cache_lock:
+        cached = cache.get(key)
+    if cached is not None:
+        return cached
+    result = await make_api_request(endpoint, params)
+    with _cache_lock:
+        cache[key] = result
+    return result
+
+
+async def make_api_request(endpoint: Endpoint, params: Dict[str, Any]) -> Dict[str, Any]:
     """
     Make a request to the Rejseplanen API with error handling.
     
     Args:
-        endpoint: API endpoint path (e.g., 'location', 'trip')
+        endpoint: API endpoint (an Endpoint member, e.g. Endpoint.TRIP)
         params: Query parameters for the request
     
     Returns:
         JSON response from the API
     
     Raises:
-        Exception: If the API request fails
+        RejseplanenError: If the API request fails
     """
-    # Always request JSON format
-    params['format'] = 'json'
-    
-    url = f"{REJSEPLANEN_API_BASE}/{endpoint}"
-    
     try:
-        response = requests.get(url, params=params, timeout=REQUEST_TIMEOUT)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.Timeout:
-        raise Exception(f"Request to Rejseplanen API timed out after {REQUEST_TIMEOUT} seconds")
-    except requests.exceptions.RequestException as e:
-        raise Exception(f"Rejseplanen API request failed: {str(e)}")
-    except ValueError as e:
-        raise Exception(f"Failed to parse JSON response: {str(e)}")
+        path = _ENDPOINT_META[endpoint]
+    except KeyError:
+        raise ValueError(f"Unknown Rejseplanen endpoint: {endpoint!r}")
+
+    key = (endpoint, frozenset(params.items()))
+    async with _inflight_lock:
+        fut = _inflight.get(key)
+        if fut is None:
+            fut = asyncio.get_running_loop().create_future()
+            _inflight[key] = fut
+            leader = True
+        else:
+            leader = False
+
+    if not leader:
+        # shield() detaches a cancelled waiter without cancelling the shared
+        # future out from under the leader and the other waiters
+        return await asyncio.shield(fut)
+
+    try:
+        result = await _fetch(path, params)
+    except Exception as e:
+        if not fut.done():
+            fut.set_exception(e)
+            fut.exception()  # mark retrieved in case no other caller is waiting
+        raise
+    else:
+        if not fut.done():
+            fut.set_result(result)
+        return result
+    finally:
+        # If the leader was cancelled (e.g. client disconnect), the future was
+        # never resolved; cancel it so attached waiters don't hang forever
+        if not fut.done():
+            fut.cancel()
+        async with _inflight_lock:
+            _inflight.pop(key, None)
+
+
+async def _fetch(path: str, params: Dict[str, Any]) -> Dict[str, Any]:
+    """Perform the actual HTTP request and decode the JSON response."""
+    response = await _get_response(path, params)
+    return _parse_api_response(response)
+
+
+async def _get_response(path: str, params: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> httpx.Response:
+    """Issue the GET request, mapping transport errors to readable exceptions."""
+    try:
+        return await _get_client().get(path, params=params, headers=headers)
+    except httpx.TimeoutException as e:
+        raise RejseplanenError(
+            f"Request to Rejseplanen API timed out after {REQUEST_TIMEOUT} seconds", code='timeout'
+        ) from e
+    except httpx.HTTPError as e:
+        raise RejseplanenError("Rejseplanen API request failed", code='http') from e
+
+
+def _parse_api_response(response: httpx.Response) -> Dict[str, Any]:
+    """Decode a response body.
+
+    Rejseplanen returns a structured JSON error envelope even on 4xx (e.g.
+    a bad station id), so the body is parsed regardless of status and the
+    upstream errorCode/errorText is surfaced instead of an opaque HTTP error.
+    """
+    if response.status_code >= 500:
+        raise RejseplanenError(
+            f"Rejseplanen API request failed with status {response.status_code}", code='http'
+        )
+
+    try:
+        # orjson consumes the raw bytes directly, skipping the intermediate
+        # str decode stdlib json would do and parsing large trip lists faster
+        data = orjson.loads(response.content)
+    except (orjson.JSONDecodeError, ValueError) as e:
+        if response.status_code >= 400:
+            raise RejseplanenError(
+                f"Rejseplanen API request failed with status {response.status_code}", code='http'
+            ) from e
+        raise RejseplanenError("Failed to parse JSON response", code='parse') from e
+
+    if response.status_code >= 400:
+        detail = None
+        if isinstance(data, dict):
+            detail = data.get('errorText') or data.get('errorCode')
+        if detail:
+            raise RejseplanenError(f"Rejseplanen API error: {detail}", code='http')
+        raise RejseplanenError(
+            f"Rejseplanen API request failed with status {response.status_code}", code='http'
+        )
+
+    return data
+
+
+async def _fetch_departures(key: tuple, params: Dict[str, Any]) -> Dict[str, Any]:
+    """Fetch a departure board, revalidating with If-None-Match when possible."""
+    with _cache_lock:
+        validator = _dep_validators.get(key)
+    headers = {'If-None-Match': validator[0]} if validator is not None else None
+
+    response = await _get_response(_ENDPOINT_META[Endpoint.DEPARTURES], params, headers)
+    if response.status_code == 304 and validator is not None:
+        _stats['dep_cache_revalidated'] += 1
+        data = validator[1]
+    else:
+        data = _parse_api_response(response)
+        etag = response.headers.get('ETag')
+        if etag:
+            with _cache_lock:
+                _dep_validators[key] = (etag, data)
+
+    with _cache_lock:
+        _dep_cache[key] = data
+    return data
 
 
 @mcp.tool()
-def location_search(query: str) -> Dict[str, Any]:
+async def location_search(query: str) -> Dict[str, Any]:
     """
     Search for stations, stops, and addresses in Denmark by name.
     Returns location IDs needed for trip searches and departure boards.
@@ -77,15 +396,13 @@ def location_search(query: str) -> Dict[str, Any]:
     Example:
         location_search(query="København H")
     """
-    if not query or not query.strip():
-        raise ValueError("Search query cannot be empty")
-    
-    params = {'input': query.strip()}
-    return make_api_request('location', params)
+    query = _require("query", query)
+    params = {'input': query}
+    return await _cached_api_request(_loc_cache, query.casefold(), Endpoint.LOCATION, params)
 
 
 @mcp.tool()
-def trip_search(
+async def trip_search(
     origin_id: str,
     dest_id: str,
     date: Optional[str] = None,
@@ -120,32 +437,64 @@ def trip_search(
     Example:
         trip_search(origin_id="008600626", dest_id="008600053")
     """
-    if not origin_id or not origin_id.strip():
-        raise ValueError("origin_id is required")
-    if not dest_id or not dest_id.strip():
-        raise ValueError("dest_id is required")
-    
-    params = {
-        'originId': origin_id.strip(),
-        'destId': dest_id.strip(),
-    }
-    
-    if date:
-        params['date'] = date
-    if time:
-        params['time'] = time
-    
-    # Transport mode filters (0 = exclude, 1 = include)
-    params['useTog'] = '1' if use_train else '0'
-    params['useBus'] = '1' if use_bus else '0'
-    params['useMetro'] = '1' if use_metro else '0'
-    params['useFerry'] = '1' if use_ferry else '0'
-    
-    return make_api_request('trip', params)
+    params = _trip_params(origin_id, dest_id, date, time, use_train, use_bus, use_metro, use_ferry)
+
+    if _realtime_cache is not None:
+        key = (Endpoint.TRIP, tuple(sorted(params.items())))
+        return await _cached_api_request(_realtime_cache, key, Endpoint.TRIP, params)
+    return await make_api_request(Endpoint.TRIP, params)
 
 
 @mcp.tool()
-def departure_board(
+async def trip_search_batch(queries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Search multiple origin/destination pairs concurrently in a single call.
+    Useful for comparing several routes (e.g. "which of these is fastest?")
+    without paying one round trip per pair.
+
+    Args:
+        queries: List of query objects, each with the same fields as trip_search:
+            - origin_id (required): Origin location ID (from location_search)
+            - dest_id (required): Destination location ID (from location_search)
+            - date: Date in DD.MM.YY format (optional)
+            - time: Time in HH:MM format (optional)
+            - use_train/use_bus/use_metro/use_ferry: Transport filters (default: True)
+
+    Returns:
+        List of results in the same order as the queries. A failed query
+        yields {"error": "..."} for that position instead of failing the batch.
+
+    Example:
+        trip_search_batch(queries=[
+            {"origin_id": "008600626", "dest_id": "008600053"},
+            {"origin_id": "008600626", "dest_id": "008600512"}
+        ])
+    """
+    if not queries:
+        raise ValueError("queries cannot be empty")
+
+    async def run_one(query: Dict[str, Any]) -> Dict[str, Any]:
+        try:
+            params = _trip_params(
+                query.get('origin_id', ''),
+                query.get('dest_id', ''),
+                date=query.get('date'),
+                time=query.get('time'),
+                use_train=query.get('use_train', True),
+                use_bus=query.get('use_bus', True),
+                use_metro=query.get('use_metro', True),
+                use_ferry=query.get('use_ferry', True),
+            )
+            async with _batch_semaphore:
+                return await make_api_request(Endpoint.TRIP, params)
+        except Exception as e:
+            return {"error": str(e)}
+
+    return list(await asyncio.gather(*(run_one(q) for q in queries)))
+
+
+@mcp.tool()
+async def departure_board(
     station_id: str,
     date: Optional[str] = None,
     time: Optional[str] = None
@@ -174,21 +523,27 @@ def departure_board(
     Example:
         departure_board(station_id="008600626")
     """
-    if not station_id or not station_id.strip():
-        raise ValueError("station_id is required")
-    
-    params = {'id': station_id.strip()}
-    
+    station_id = _require("station_id", station_id)
+    params = {'id': station_id}
+
     if date:
         params['date'] = date
     if time:
         params['time'] = time
-    
-    return make_api_request('departureBoard', params)
+
+    key = (station_id, date, time)
+    with _cache_lock:
+        cached = _dep_cache.get(key)
+    if cached is not None:
+        _stats['dep_cache_hits'] += 1
+        return cached
+    _stats['dep_cache_misses'] += 1
+
+    return await _fetch_departures(key, params)
 
 
 @mcp.tool()
-def nearby_stops(
+async def nearby_stops(
     latitude: float,
     longitude: float,
     max_radius: int = 1000,
@@ -201,8 +556,8 @@ def nearby_stops(
     Args:
         latitude: Latitude coordinate (e.g., 55.6761 for Copenhagen)
         longitude: Longitude coordinate (e.g., 12.5683 for Copenhagen)
-        max_radius: Maximum search radius in meters (default: 1000, max: 10000)
-        max_number: Maximum number of results to return (default: 10, max: 50)
+        max_radius: Maximum search radius in meters (default: 1000, clamped to 1-10000)
+        max_number: Maximum number of results to return (default: 10, clamped to 1-50)
     
     Returns:
         Dictionary containing:
@@ -216,32 +571,25 @@ def nearby_stops(
     Example:
         nearby_stops(latitude=55.6761, longitude=12.5683, max_radius=500)
     """
-    # Validate coordinates
-    if not (-90 <= latitude <= 90):
-        raise ValueError("Latitude must be between -90 and 90")
-    if not (-180 <= longitude <= 180):
-        raise ValueError("Longitude must be between -180 and 180")
-    
-    # Validate and limit radius
-    if max_radius < 1:
-        raise ValueError("max_radius must be at least 1 meter")
-    if max_radius > 10000:
-        max_radius = 10000  # API limit
-    
-    # Validate and limit number of results
-    if max_number < 1:
-        raise ValueError("max_number must be at least 1")
-    if max_number > 50:
-        max_number = 50  # Reasonable limit
+    # Out-of-range coordinates are caller errors; the limits are merely
+    # clamped to what the API accepts
+    if abs(latitude) > 90 or abs(longitude) > 180:
+        raise ValueError("Coordinates out of range: latitude must be within +/-90, longitude within +/-180")
+
+    max_radius = min(max(1, max_radius), 10000)
+    max_number = min(max(1, max_number), 50)
     
+    # Fixed 6-decimal precision (~11 cm) is plenty for stop search and cheaper
+    # than full-repr str(float); httpx stringifies the ints itself
     params = {
-        'coordX': str(longitude),
-        'coordY': str(latitude),
-        'maxRadius': str(max_radius),
-        'maxNumber': str(max_number)
+        'coordX': f"{longitude:.6f}",
+        'coordY': f"{latitude:.6f}",
+        'maxRadius': max_radius,
+        'maxNumber': max_number
     }
-    
-    return make_api_request('stopsNearby', params)
+
+    key = (round(latitude, 5), round(longitude, 5), max_radius, max_number)
+    return await _cached_api_request(_nearby_cache, key, Endpoint.NEARBY, params)
 
 
 @mcp.tool()
@@ -252,34 +600,22 @@ def get_server_info() -> Dict[str, Any]:
     Returns:
         Dictionary containing server metadata
     """
-    return {
-        "server_name": "Rejseplanen MCP Server",
-        "version": "1.0.0",
-        "environment": os.environ.get("ENVIRONMENT", "development"),
-        "python_version": sys.version.split()[0],
-        "api_base": REJSEPLANEN_API_BASE,
-        "transport": "HTTP (Stateless)",
-        "tools": [
-            "location_search",
-            "trip_search",
-            "departure_board",
-            "nearby_stops",
-            "get_server_info"
-        ],
-        "description": "MCP server for Danish public transportation via Rejseplanen.dk API 2.0"
-    }
+    return dict(_SERVER_INFO)
 
 
 if __name__ == "__main__":
-    # Get port from environment variable (used by Render and other cloud platforms)
-    port = int(os.environ.get("PORT", 8000))
+    # uvloop halves per-callback dispatch cost on Linux; FastMCP picks up
+    # the installed loop automatically
+    if sys.platform != "win32":
+        import uvloop
+        uvloop.install()
+
+    port = _parse_port()
     host = "0.0.0.0"  # Listen on all interfaces for cloud deployment
-    
-    print(f"🚆 Starting Rejseplanen MCP Server on {host}:{port}")
-    print(f"📍 API Endpoint: http://{host}:{port}/mcp")
-    print(f"🌍 Environment: {os.environ.get('ENVIRONMENT', 'development')}")
-    print(f"🔧 Python Version: {sys.version.split()[0]}")
-    print("\n✅ Server ready to accept connections...\n")
+
+    # One write + flush instead of a syscall per print() line
+    sys.stdout.write(_BANNER.format(host=host, port=port))
+    sys.stdout.flush()
     
     # Run the FastMCP server with HTTP transport
     mcp.run(